@@ -0,0 +1,338 @@
+# ==============================================================================
+# 🛠️ FUNGSI KALKULASI (untuk Tabs)
+# ==============================================================================
+# Dipisah dari app.py: modul ini di-import sekali per proses, sedangkan app.py
+# dieksekusi ulang dari atas ke bawah oleh Streamlit pada setiap interaksi widget.
+import streamlit as st
+import pandas as pd
+import numpy as np
+
+# --- KONFIGURASI KATEGORI (PENTING) ---
+OWNERSHIP_COLS = [
+    'Local IS', 'Local CP', 'Local PF', 'Local IB', 'Local ID', 'Local MF', 'Local SC', 'Local FD', 'Local OT',
+    'Foreign IS', 'Foreign CP', 'Foreign PF', 'Foreign IB', 'Foreign ID', 'Foreign MF', 'Foreign SC', 'Foreign FD', 'Foreign OT'
+]
+OWNERSHIP_CHG_COLS = [f"{col}_chg" for col in OWNERSHIP_COLS]
+LOCAL_CHG_COLS = [col for col in OWNERSHIP_CHG_COLS if col.startswith('Local')]
+FOREIGN_CHG_COLS = [col for col in OWNERSHIP_CHG_COLS if col.startswith('Foreign')]
+# Daftar opsi widget kategori (urut abjad), dihitung sekali saat import
+ALL_CATEGORIES_SORTED = sorted(OWNERSHIP_COLS)
+# Batas titik per garis chart kumulatif Tab 1 (downsampling LTTB di atas ini)
+CUM_FLOW_MAX_POINTS = 1500
+
+def month_index(dates):
+    """Nomor bulan absolut (tahun*12 + bulan-1) dari Series datetime, sebagai ndarray int64."""
+    return dates.dt.year.to_numpy(np.int64) * 12 + dates.dt.month.to_numpy(np.int64) - 1
+
+def month_index_to_timestamp(month_idx):
+    """Kebalikan month_index: nomor bulan absolut -> datetime64[ns] awal bulan ('MS')."""
+    return (np.asarray(month_idx, dtype=np.int64) - 1970 * 12).astype('datetime64[M]').astype('datetime64[ns]')
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indeks n_out titik yang mempertahankan bentuk garis (x naik).
+
+    Loop per bucket (bukan per titik), tiap bucket dihitung vektor NumPy.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out-2 bucket di antara titik pertama & terakhir (yang selalu dipertahankan)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        # Luas segitiga (titik terpilih sebelumnya, kandidat, rata-rata bucket berikutnya)
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+def year_mask(year_col, years):
+    """Boolean mask kolom Year (int16): 1 tahun -> satu perbandingan `==`, >1 -> isin."""
+    year_arr = year_col.to_numpy()
+    if len(years) == 1:
+        return year_arr == year_arr.dtype.type(years[0])
+    return np.isin(year_arr, np.asarray(years, dtype=year_arr.dtype))
+
+@st.cache_resource(max_entries=8)
+def slice_years(_df, data_key, years):
+    """Frame yang sudah difilter tahun. Dikunci (data_key, years) -> tanpa hash DataFrame.
+
+    `_df` terurut Date (lihat load_data), jadi tiap tahun adalah satu blok baris kontigu:
+    batasnya dicari via searchsorted (O(log N)), bukan mask isin O(N).
+    """
+    year_arr = _df['Year'].to_numpy()
+    years_arr = np.sort(np.asarray(years, dtype=year_arr.dtype))
+    if years_arr.size == 0:
+        return _df.iloc[0:0]
+    starts = np.searchsorted(year_arr, years_arr, side='left')
+    ends = np.searchsorted(year_arr, years_arr, side='right')
+    if (starts[1:] == ends[:-1]).all():
+        # Blok tahun bersambung -> satu slice posisi (view, tanpa copy)
+        return _df.iloc[starts[0]:ends[-1]]
+    return _df.iloc[np.concatenate([np.arange(lo, hi) for lo, hi in zip(starts, ends)])]
+
+@st.cache_data
+def unique_years(_df, data_key):
+    """(SIDEBAR) Daftar tahun tersedia, terbaru dulu."""
+    return sorted(_df['Year'].unique().tolist(), reverse=True)
+
+@st.cache_data
+def unique_codes_for_years(_df, data_key, years):
+    """(SIDEBAR & TAB 3) Daftar kode saham terurut yang muncul pada tahun terpilih."""
+    # Kategori Code sudah terurut (astype('category')) -> tanpa unique scan + sort Python
+    return slice_years(_df, data_key, years)['Code'].cat.remove_unused_categories().cat.categories.tolist()
+
+@st.cache_resource(max_entries=8)
+def compute_flow_cube(_df, data_key, years):
+    """(TAB 1 & 2) Agregat (Date, Sector) dari semua kolom _chg + total, sekali per filter tahun.
+
+    Macro flow & rotasi sektor diturunkan dari cube kecil ini (tanggal x sektor baris),
+    bukan scan ulang N baris x 18 kolom setiap ganti tab/kategori. Terurut (Date, Sector).
+    """
+    df_filtered_by_year = slice_years(_df, data_key, years)
+    return df_filtered_by_year.groupby(['Date', 'Sector'], observed=True, sort=True)[
+        OWNERSHIP_CHG_COLS + ['Total_Local_chg', 'Total_Foreign_chg']
+    ].sum().reset_index()
+
+@st.cache_data
+def calculate_macro_flow(_df, data_key, years):
+    """(TAB 1) Menghitung total aliran dana per kategori di seluruh market.
+
+    `net_flow` tidak diurutkan; pemanggil mengambil top-K via nlargest/nsmallest.
+    """
+    cube = compute_flow_cube(_df, data_key, years)
+    # Satu reduksi kolom di ndarray untuk total per kategori
+    net_flow = pd.DataFrame({
+        'Kategori': OWNERSHIP_COLS, # = OWNERSHIP_CHG_COLS tanpa sufiks '_chg' (urutan sama)
+        'Total Net Flow (Shares)': cube[OWNERSHIP_CHG_COLS].to_numpy().sum(axis=0),
+    })
+
+    # Kumulatif memakai total Lokal/Asing yang sudah dihitung saat load (2 kolom, bukan 18).
+    # Cube terurut Date -> sum per tanggal = np.add.reduceat di batas tanggal (tanpa groupby).
+    dates = cube['Date'].to_numpy()
+    if dates.size == 0:
+        return net_flow, pd.DataFrame(columns=['Date', 'Kategori', 'Cumulative Flow'])
+    date_starts = np.flatnonzero(np.append(True, dates[1:] != dates[:-1]))
+    totals = cube[['Total_Local_chg', 'Total_Foreign_chg']].to_numpy()
+    cum_vals = np.add.reduceat(totals, date_starts, axis=0).cumsum(axis=0)
+    flow_dates = dates[date_starts]
+
+    # Histori multi-tahun -> LTTB per garis: bentuk kurva tetap, titik ke Plotly dibatasi
+    x_ns = flow_dates.astype('datetime64[ns]').astype(np.int64)
+    kept = [lttb_indices(x_ns, cum_vals[:, j], CUM_FLOW_MAX_POINTS) for j in range(cum_vals.shape[1])]
+    cum_flow = pd.DataFrame({
+        'Date': np.concatenate([flow_dates[idx] for idx in kept]),
+        'Kategori': pd.Categorical.from_codes(
+            np.repeat([0, 1], [len(idx) for idx in kept]), categories=['Total_Local (Net)', 'Total_Foreign (Net)']),
+        'Cumulative Flow': np.concatenate([cum_vals[idx, j] for j, idx in enumerate(kept)]),
+    })
+
+    return net_flow, cum_flow
+
+@st.cache_data
+def calculate_sector_rotation(_df, data_key, years, selected_category):
+    """(TAB 2) Menghitung aliran dana bersih kategori tertentu per sektor (dari flow cube).
+
+    Hasil tidak diurutkan; pemanggil mengambil top-K via nlargest/nsmallest.
+    """
+    cube = compute_flow_cube(_df, data_key, years)
+    if 'Sector' not in cube.columns or cube['Sector'].nunique() <= 1:
+        return pd.DataFrame(), "Data sektor tidak tersedia atau hanya 'Others'."
+    category_chg_col = f"{selected_category}_chg"
+    if category_chg_col not in cube.columns:
+        return pd.DataFrame(), f"Kolom '{category_chg_col}' tidak ditemukan."
+
+    # Sum per kode kategori Sector via bincount atas baris cube (tanggal x sektor, bukan N baris)
+    sector_dtype = cube['Sector'].dtype
+    sector_code = cube['Sector'].cat.codes.to_numpy(np.int64)
+    n_sectors = len(sector_dtype.categories)
+    sums = np.bincount(sector_code, weights=cube[category_chg_col].to_numpy(np.float64), minlength=n_sectors)
+    present = np.flatnonzero(np.bincount(sector_code, minlength=n_sectors)) # = observed=True
+
+    sector_category_flow = pd.DataFrame({
+        'Sector': pd.Categorical.from_codes(present, dtype=sector_dtype),
+        'Net Flow (Shares)': sums[present].round().astype(np.int64),
+    })
+    return sector_category_flow, None
+
+@st.cache_data
+def calculate_monthly_sector_flow(_monthly_panel, data_key, years, top_n=10):
+    """(TAB 4 Chart) Menghitung total aliran dana bersih bulanan per sektor (dari panel bulanan).
+
+    Hanya `top_n` sektor dengan total |flow| bulanan terbesar yang di-materialize.
+    """
+    df_monthly = _monthly_panel[year_mask(_monthly_panel['Year'], years)]
+    if 'Sector' not in df_monthly.columns or df_monthly['Sector'].nunique() <= 1:
+        return pd.DataFrame(), "Data sektor tidak tersedia."
+    month_idx = month_index(df_monthly['Date'])
+    month_min = month_idx.min()
+    month_code = month_idx - month_min
+    n_months = int(month_code.max()) + 1
+    sector_dtype = df_monthly['Sector'].dtype
+    sector_code = df_monthly['Sector'].cat.codes.to_numpy(np.int64)
+    n_sectors = len(sector_dtype.categories)
+
+    # Scatter-sum (sektor, bulan) dalam satu pass C via bincount, tanpa groupby.resample
+    flat_key = sector_code * n_months + month_code
+    grid_size = n_sectors * n_months
+    sums = np.bincount(flat_key, weights=df_monthly['Total_chg'].to_numpy(np.float64), minlength=grid_size)
+    observed = np.bincount(flat_key, minlength=grid_size) > 0
+    sums = sums.reshape(n_sectors, n_months)
+    observed = observed.reshape(n_sectors, n_months)
+
+    # Sama seperti resample per grup: semua bulan antara bulan pertama & terakhir tiap sektor
+    months = np.arange(n_months)
+    first = observed.argmax(axis=1)
+    last = n_months - 1 - observed[:, ::-1].argmax(axis=1)
+    in_span = observed.any(axis=1)[:, None] & (months >= first[:, None]) & (months <= last[:, None])
+    net_grid = sums.round()
+
+    # Top-N dipilih di grid (sektor x bulan), sebelum frame long dibangun.
+    # argsort stabil = nlargest(keep='first'): seri diurutkan menurut kode sektor.
+    candidates = np.flatnonzero(in_span.any(axis=1))
+    abs_total = np.abs(net_grid[candidates]).sum(axis=1)
+    top_sectors = candidates[np.argsort(-abs_total, kind='stable')[:top_n]]
+    keep_sector = np.zeros(n_sectors, dtype=bool)
+    keep_sector[top_sectors] = True
+    sec_idx, mon_idx = np.nonzero(in_span & keep_sector[:, None])
+
+    monthly_sector_flow = pd.DataFrame({
+        # str (bukan category) -> tidak ada trace kosong dari kategori sektor tak terpakai
+        'Sector': sector_dtype.categories.to_numpy()[sec_idx].astype(str),
+        'Month': month_index_to_timestamp(mon_idx + month_min),
+        'Net Flow (Shares)': net_grid[sec_idx, mon_idx].astype(np.int64),
+    })
+    return monthly_sector_flow, None
+
+@st.cache_resource(max_entries=2)
+def index_by_code(_df, data_key):
+    """(TAB 3) Frame terurut (Code, Date) dengan index Code, untuk slicing per saham.
+
+    `data_key` (versi file sumber) menggantikan hash DataFrame sebagai kunci cache.
+    """
+    return _df.sort_values(['Code', 'Date']).set_index('Code', drop=False)
+
+def get_stock_rows(df_by_code, stock_code):
+    """Mengambil semua baris 1 saham via index terurut (searchsorted, bukan scan O(N))."""
+    if stock_code not in df_by_code.index:
+        return df_by_code.iloc[0:0]
+    loc = df_by_code.index.get_loc(stock_code)
+    if isinstance(loc, (int, np.integer)):
+        return df_by_code.iloc[[loc]]
+    return df_by_code.iloc[loc]
+
+@st.cache_resource(max_entries=16)
+def stock_rows_for_years(_df_by_code, data_key, frame_name, stock_code, years):
+    """(TAB 3) Baris 1 saham pada tahun terpilih, di-cache per (frame, saham, tahun).
+
+    `frame_name` membedakan frame ber-index Code yang dipakai ('daily' / 'monthly').
+    """
+    df_stock = get_stock_rows(_df_by_code, stock_code)
+    return df_stock[year_mask(df_stock['Year'], years)]
+
+@st.cache_resource(max_entries=2)
+def compute_latest_rows(_df, data_key):
+    """(TAB 3) Tabel baris TERBARU per Code (index Code), dihitung sekali per versi data."""
+    latest_idx = _df.groupby('Code', observed=True)['Date'].idxmax()
+    return _df.loc[latest_idx].set_index('Code')
+
+@st.cache_data
+def get_stock_ownership_state(_latest_rows, data_key, stock_code):
+    """(TAB 3 Pie) Mengambil data kepemilikan TERBARU untuk 1 saham dari tabel latest per Code."""
+    if stock_code not in _latest_rows.index:
+        return pd.DataFrame(), pd.Series(dtype='object')
+
+    latest_row = _latest_rows.loc[stock_code]
+    # Dibangun eksplisit dari konstanta kolom (tanpa reset_index + assign .columns)
+    df_state = pd.DataFrame({
+        'Kategori': OWNERSHIP_COLS,
+        'Jumlah Saham': latest_row[OWNERSHIP_COLS].to_numpy(dtype=np.int64),
+    })
+
+    total_shares_pie1 = df_state['Jumlah Saham'].sum()
+    if total_shares_pie1 > 0:
+        df_state['Persentase'] = (df_state['Jumlah Saham'] / total_shares_pie1) * 100
+    else:
+        df_state['Persentase'] = 0
+
+    return df_state.sort_values(by='Jumlah Saham', ascending=False), latest_row
+
+@st.cache_data
+def calculate_monthly_shareholder_change_table(_df_stock, data_key, stock_code, years):
+    """(TAB 3 Table) Menghitung perubahan bulanan per kategori shareholder.
+
+    Dikunci (data_key, stock_code, years); frame saham `_df_stock` tidak di-hash.
+    """
+    if _df_stock.empty:
+        return pd.DataFrame()
+    month_idx = month_index(_df_stock['Date'])
+    # _df_stock terurut Date -> baris terakhir tiap bulan = snapshot kepemilikan akhir bulan
+    is_month_end = np.append(month_idx[1:] != month_idx[:-1], True)
+    monthly_snapshot = pd.DataFrame(
+        _df_stock[OWNERSHIP_COLS].to_numpy()[is_month_end],
+        index=month_index_to_timestamp(month_idx[is_month_end]),
+        columns=OWNERSHIP_COLS
+    )
+    # Bulan tanpa data tetap muncul (NaN) seperti resample('MS')
+    full_range = pd.date_range(monthly_snapshot.index[0], monthly_snapshot.index[-1], freq='MS')
+    monthly_snapshot = monthly_snapshot.reindex(full_range)
+
+    # Hitung perubahan dari bulan sebelumnya (.diff)
+    monthly_changes = monthly_snapshot.diff().fillna(0) # Isi NaN di bulan pertama dengan 0
+
+    monthly_changes = monthly_changes.sort_index(ascending=False)
+    monthly_changes = monthly_changes.rename_axis('Month').reset_index()
+    return monthly_changes
+
+
+# [PERUBAHAN] Fungsi untuk line chart histori kepemilikan (REAL)
+@st.cache_data
+def calculate_historical_ownership_raw(_df_stock, data_key, stock_code, years):
+    """(TAB 3 Line Chart) Mengambil data kepemilikan historis (jumlah saham) per kategori.
+
+    Dikunci (data_key, stock_code, years); frame saham `_df_stock` tidak di-hash.
+    """
+    if _df_stock.empty or not all(col in _df_stock.columns for col in OWNERSHIP_COLS):
+        return pd.DataFrame()
+
+    # Thinning: maks. 1 titik per minggu (W-FRI, baris terakhir) -> payload Plotly tetap kecil
+    # untuk histori panjang. _df_stock sudah terurut Date.
+    dates = _df_stock['Date'].to_numpy()
+    week_id = (dates - np.datetime64('1970-01-03')) // np.timedelta64(7, 'D') # 1970-01-03 = Sabtu
+    is_week_end = np.append(week_id[1:] != week_id[:-1], True)
+    dates = dates[is_week_end]
+
+    # Kolom urut abjad = urutan 'Kategori' yang sama dengan sort_values(['Date', 'Kategori'])
+    sorted_cols = sorted(OWNERSHIP_COLS)
+    vals = _df_stock[sorted_cols].to_numpy()[is_week_end]
+
+    # Filter kategori yang selalu 0
+    active = vals.sum(axis=0) != 0
+    active_cols = np.array(sorted_cols)[active]
+
+    # Wide -> long langsung via repeat/tile (tanpa melt + groupby + sort)
+    return pd.DataFrame({
+        'Date': np.repeat(dates, active.sum()),
+        # Kategori sebagai category: kode int per baris, bukan string berulang
+        'Kategori': pd.Categorical.from_codes(np.tile(np.arange(len(active_cols)), len(dates)), categories=active_cols),
+        'Jumlah Saham': vals[:, active].ravel(),
+    })
+
+
+def highlight_max_min(df_values):
+    '''Highlight maximum (positive) in green and minimum (negative) in red, per row, in one NumPy pass.'''
+    arr = df_values.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    styles = np.full(arr.shape, '', dtype=object)
+    # -inf/+inf sebagai pengisi agar baris tanpa nilai positif/negatif tidak pernah match
+    row_max = np.where(arr > 0, arr, -np.inf).max(axis=1, keepdims=True)
+    row_min = np.where(arr < 0, arr, np.inf).min(axis=1, keepdims=True)
+    styles[(arr == row_max) & (arr > 0)] = 'background-color: lightgreen'
+    styles[(arr == row_min) & (arr < 0)] = 'background-color: lightcoral'
+    return pd.DataFrame(styles, index=df_values.index, columns=df_values.columns)
@@ -3,16 +3,40 @@
 # ==============================================================================
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-# from plotly.subplots import make_subplots # Tidak digunakan lagi di Tab 3
 import numpy as np
-import io
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import os
+import csv
+import json
+import hashlib
+import tempfile
+import glob
+from datetime import datetime, timezone
+from pandas.tseries.api import guess_datetime_format
+from concurrent.futures import ThreadPoolExecutor
+
+# Fungsi kalkulasi & konstanta kategori (modul terpisah, di-import sekali)
+from analytics import (
+    OWNERSHIP_COLS, OWNERSHIP_CHG_COLS, LOCAL_CHG_COLS, FOREIGN_CHG_COLS, ALL_CATEGORIES_SORTED,
+    slice_years, unique_years, unique_codes_for_years,
+    compute_flow_cube, calculate_macro_flow, calculate_sector_rotation, calculate_monthly_sector_flow,
+    index_by_code, stock_rows_for_years, compute_latest_rows, get_stock_ownership_state,
+    calculate_monthly_shareholder_change_table, calculate_historical_ownership_raw,
+    highlight_max_min,
+)
+
+# Figure Plotly ter-cache per input (modul terpisah, di-import sekali)
+from charts import (
+    macro_cum_flow_figure, flow_bars_figure, ownership_pies_figure, historical_ownership_figure,
+    monthly_sector_flow_figure,
+)
 
 # Import library Google
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
+from google.auth.transport.requests import AuthorizedSession, Request
 
 # ==============================================================================
 # ⚙️ 2) KONFIGURASI DASHBOARD & G-DRIVE
@@ -27,227 +51,377 @@ st.set_page_config(
 FOLDER_ID = "1hX2jwUrAgi4Fr8xkcFWjCW6vbk6lsIlP"
 FILE_NAME = "KSEI_Shareholder_Processed.csv"
 
-# --- KONFIGURASI KATEGORI (PENTING) ---
-OWNERSHIP_COLS = [
-    'Local IS', 'Local CP', 'Local PF', 'Local IB', 'Local ID', 'Local MF', 'Local SC', 'Local FD', 'Local OT',
-    'Foreign IS', 'Foreign CP', 'Foreign PF', 'Foreign IB', 'Foreign ID', 'Foreign MF', 'Foreign SC', 'Foreign FD', 'Foreign OT'
-]
-OWNERSHIP_CHG_COLS = [f"{col}_chg" for col in OWNERSHIP_COLS]
+# --- KONFIGURASI CACHE DISK ---
+# Hasil bersih load_data disimpan sebagai Parquet agar cold start tidak perlu
+# download + parsing ulang selama file di GDrive belum berubah.
+CACHE_DIR = tempfile.gettempdir()
+CACHE_SCHEMA_VERSION = 7  # Naikkan setiap kali kolom/dtype/urutan hasil load_data berubah
+
+# --- KONFIGURASI DOWNLOAD ---
+# File besar di-download paralel (HTTP Range GET) agar bandwidth terpakai penuh.
+DOWNLOAD_WORKERS = 8
+PARALLEL_DOWNLOAD_MIN_BYTES = 10 * 1024 * 1024
+DOWNLOAD_CHUNK_BYTES = 8 * 1024 * 1024  # Chunk download serial (default googleapiclient hanya 100 KB)
+
+# Kolom teks dibaca apa adanya; sisanya di-infer langsung oleh C parser pandas
+TEXT_COL_DTYPES = {'Code': object, 'Sector': object, 'Top_Buyer': object, 'Top_Seller': object}
+
+# Hanya kolom yang dipakai dashboard yang diparsing; kolom lain di CSV dilewati C parser
+NEEDED_COLS = frozenset(
+    ['Date', 'Price', 'Price_Chg %', 'Free Float', 'Total_Local', 'Total_Foreign',
+     'Top_Buyer_Vol', 'Top_Seller_Vol', 'Sec. Num']
+    + list(TEXT_COL_DTYPES) + OWNERSHIP_COLS + OWNERSHIP_CHG_COLS
+)
+# Hapus pemisah ribuan + whitespace dalam satu pass (pengganti strip() + replace(','))
+NUMERIC_STRIP_TABLE = str.maketrans('', '', ', \t\r\n')
+CSV_CHUNK_ROWS = 200_000  # Baris per potongan read_csv (batas puncak RAM saat parsing)
+ARROW_BLOCK_BYTES = 8 * 1024 * 1024  # Ukuran blok streaming PyArrow CSV
+
+# --- KONFIGURASI SCREENER ---
+# Batas baris tabel screener yang dikirim ke browser (serialisasi Arrow per rerun)
+SCREENER_MAX_ROWS = 500
+SCREENER_SHOW_ALL_LIMIT = 10_000  # Di atas ini opsi "Tampilkan semua" tidak ditawarkan
 
 # ==============================================================================
 # 📦 3) FUNGSI MEMUAT DATA (via SERVICE ACCOUNT)
 # ==============================================================================
+@st.cache_resource
+def build_gdrive_service():
+    """Client Drive + credentials, dibuat sekali per proses (resource: sesi HTTP, bukan data).
+
+    Exception tidak di-cache oleh Streamlit, jadi kegagalan otentikasi akan dicoba ulang.
+    """
+    creds_json = st.secrets["gcp_service_account"]
+    creds = Credentials.from_service_account_info(creds_json, scopes=['https://www.googleapis.com/auth/drive.readonly'])
+    service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    return service, creds
+
 def get_gdrive_service():
     try:
-        creds_json = st.secrets["gcp_service_account"]
-        creds = Credentials.from_service_account_info(creds_json, scopes=['https://www.googleapis.com/auth/drive.readonly'])
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
-        return service, None
+        service, creds = build_gdrive_service()
+        return service, creds, None
     except KeyError:
         msg = "❌ Gagal otentikasi: 'st.secrets' tidak menemukan key [gcp_service_account]."
-        return None, msg
+        return None, None, msg
     except Exception as e:
         msg = f"❌ Gagal otentikasi Google Drive: {e}."
-        return None, msg
+        return None, None, msg
+
+def get_cache_paths(file_id, file_meta):
+    """Path Parquet + metadata JSON, dikunci oleh md5Checksum (fallback: modifiedTime)."""
+    version = file_meta.get('md5Checksum') or hashlib.md5(
+        file_meta.get('modifiedTime', '').encode()
+    ).hexdigest()
+    base = os.path.join(CACHE_DIR, f"ksei_v{CACHE_SCHEMA_VERSION}_{file_id}_{version}")
+    return f"{base}.parquet", f"{base}.json"
+
+def read_disk_cache(cache_path):
+    """Membaca DataFrame dari cache Parquet. Return None jika belum ada / rusak."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        return pd.read_parquet(cache_path)
+    except Exception:
+        return None
+
+def write_disk_cache(df, cache_path, meta_path, file_meta):
+    """Menyimpan DataFrame bersih + metadata. Gagal tulis tidak menghentikan dashboard."""
+    tmp_path = None
+    try:
+        # Temp unik per penulis: proses lain yang menulis versi sama tidak saling menimpa
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f"{os.path.basename(cache_path)}.", suffix=".tmp")
+        os.close(fd)
+        df.to_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+        meta = {
+            'file_id': file_meta.get('id'),
+            'md5Checksum': file_meta.get('md5Checksum'),
+            'modifiedTime': file_meta.get('modifiedTime'),
+            'size': file_meta.get('size'),
+            'ingested_at': datetime.now(timezone.utc).isoformat(),
+        }
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        prune_disk_cache(file_meta.get('id'), cache_path, meta_path)
+    except Exception:
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+def prune_disk_cache(file_id, keep_cache_path, keep_meta_path):
+    """Hapus cache versi lama (checksum/skema berbeda) milik file yang sama agar /tmp tidak menumpuk."""
+    for path in glob.glob(os.path.join(CACHE_DIR, f"ksei_v*_{file_id}_*")):
+        # .tmp = tulisan proses lain yang sedang berjalan -> jangan dihapus
+        if path in (keep_cache_path, keep_meta_path) or path.endswith('.tmp'):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def download_to_tempfile(request):
+    """Men-stream isi file GDrive langsung ke file temporer (bukan BytesIO). Return path file."""
+    fh = tempfile.NamedTemporaryFile(suffix=".csv", delete=False, dir=CACHE_DIR)
+    try:
+        downloader = MediaIoBaseDownload(fh, request, chunksize=DOWNLOAD_CHUNK_BYTES)
+        done = False
+        while done is False:
+            status, done = downloader.next_chunk()
+        fh.flush()
+    except Exception:
+        fh.close()
+        os.remove(fh.name)
+        raise
+    fh.close()
+    return fh.name
+
+class RangeDownloadError(RuntimeError):
+    """Download paralel tidak bisa dipakai (Range diabaikan / rentang tidak lengkap)."""
+
+def download_parallel_to_tempfile(creds, file_id, size):
+    """Download paralel per rentang byte (Range GET) langsung ke offset-nya di file temporer."""
+    # Token di-refresh sekali di thread utama; worker hanya membaca token yang sudah valid
+    if not creds.valid:
+        creds.refresh(Request())
+    url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+    part_size = -(-size // DOWNLOAD_WORKERS)
+    byte_ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    fh = tempfile.NamedTemporaryFile(suffix=".csv", delete=False, dir=CACHE_DIR)
+    fh.truncate(size)
+    fh.close()
+
+    def fetch_range(byte_range):
+        start, end = byte_range
+        # Satu session per worker: requests.Session tidak dijamin thread-safe
+        with AuthorizedSession(creds) as session:
+            resp = session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=300)
+            resp.raise_for_status()
+            if resp.status_code != 206:
+                raise RangeDownloadError(f"Server tidak mendukung Range GET (status {resp.status_code}).")
+            written = 0
+            with open(fh.name, 'r+b') as out:
+                out.seek(start)
+                for chunk in resp.iter_content(chunk_size=1 << 20):
+                    out.write(chunk)
+                    written += len(chunk)
+        # Bagian yang tidak lengkap akan tetap berisi byte nol dari truncate() -> jangan diparsing
+        if written != end - start + 1:
+            raise RangeDownloadError(f"Rentang {start}-{end} tidak lengkap ({written} byte).")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(byte_ranges)) as pool:
+            list(pool.map(fetch_range, byte_ranges))
+    except Exception:
+        os.remove(fh.name)
+        raise
+    return fh.name
+
+def clean_csv_chunk(chunk, date_state):
+    """Pembersihan 1 potongan CSV: tanggal, kolom numerik, baris invalid, dan downcast dtype.
+
+    `date_state` = dict bersama antar chunk 1 file (menyimpan format fallback tanggal).
+    """
+    chunk.columns = chunk.columns.str.strip()
+    raw_dates = chunk['Date']
+    # Format fallback ditebak SEKALI dari tanggal pertama file (seperti inferensi atas seluruh
+    # kolom), bukan per chunk -> tidak ada chunk yang diam-diam terbaca %m/%d vs %d/%m
+    if 'fallback_format' not in date_state:
+        first_valid = raw_dates.first_valid_index()
+        if first_valid is not None:
+            date_state['fallback_format'] = guess_datetime_format(str(raw_dates[first_valid])) or 'mixed'
+    # Fast path C parser ISO8601 (tanggal unik di-cache); fallback format tetap jika ada yg gagal
+    dates = pd.to_datetime(raw_dates, format='ISO8601', errors='coerce', cache=True)
+    if (dates.isna() & raw_dates.notna()).any():
+        dates = pd.to_datetime(raw_dates, format=date_state['fallback_format'], errors='coerce', cache=True)
+    chunk['Date'] = dates
+
+    cols_to_numeric = [
+        'Price', 'Price_Chg %', 'Free Float', 'Total_Local', 'Total_Foreign',
+        'Top_Buyer_Vol', 'Top_Seller_Vol', 'Sec. Num'
+    ] + OWNERSHIP_COLS + OWNERSHIP_CHG_COLS
+
+    numeric_cols = [col for col in cols_to_numeric if col in chunk.columns]
+    # Kolom yang gagal diparsing C parser (mis. ada teks/spasi) masih object -> bersihkan sekali jalan
+    object_cols = [col for col in numeric_cols if not pd.api.types.is_numeric_dtype(chunk[col])]
+    if object_cols:
+        chunk[object_cols] = chunk[object_cols].apply(
+            lambda s: pd.to_numeric(s.astype(str).str.translate(NUMERIC_STRIP_TABLE), errors='coerce')
+        )
+    chunk[numeric_cols] = chunk[numeric_cols].fillna(0)
+
+    chunk = chunk.dropna(subset=['Date', 'Code'])
+    chunk['Year'] = chunk['Date'].dt.year.astype('int16')
+
+    # Jumlah saham selalu bulat dan bisa > 2^31; float32 hanya presisi ~7 digit -> int64
+    share_cols = [
+        col for col in OWNERSHIP_COLS + OWNERSHIP_CHG_COLS
+        + ['Total_Local', 'Total_Foreign', 'Top_Buyer_Vol', 'Top_Seller_Vol', 'Sec. Num']
+        if col in chunk.columns
+    ]
+    chunk[share_cols] = chunk[share_cols].round().astype('int64')
+
+    # Harga & persentase cukup float32 (nilai < 1e7, presisi 7 digit memadai)
+    ratio_cols = [col for col in ('Price', 'Price_Chg %', 'Free Float') if col in chunk.columns]
+    chunk[ratio_cols] = chunk[ratio_cols].astype('float32')
+    return chunk
+
+def read_csv_arrow(csv_path):
+    """Parsing CSV via PyArrow (C++ multithread), di-stream per blok lalu dibersihkan per potongan."""
+    with open(csv_path, newline='', encoding='utf-8-sig') as f: # -sig: BOM dilewati seperti Arrow
+        header = next(csv.reader(f), [])
+    include_cols = [col for col in header if col.strip() in NEEDED_COLS]
+    convert_options = pacsv.ConvertOptions(
+        include_columns=include_cols,
+        column_types={col: pa.string() for col in include_cols if col.strip() in TEXT_COL_DTYPES},
+        strings_can_be_null=True,
+    )
+    reader = pacsv.open_csv(
+        csv_path, read_options=pacsv.ReadOptions(block_size=ARROW_BLOCK_BYTES),
+        convert_options=convert_options,
+    )
+    # Kolom ber-pemisah ribuan terbaca string -> ditangani fallback object di clean_csv_chunk
+    date_state = {}
+    return pd.concat(
+        [clean_csv_chunk(batch.to_pandas(coerce_temporal_nanoseconds=True), date_state) for batch in reader],
+        ignore_index=True,
+    )
+
+def read_csv_pandas(csv_path):
+    """Fallback: C parser pandas per potongan (toleran tipe campuran antar blok)."""
+    # Dibaca per potongan: pembersihan + downcast per chunk menjaga puncak RAM di
+    # ukuran chunk (bukan seluruh file) sebelum digabung
+    reader = pd.read_csv(
+        csv_path, thousands=',', dtype=TEXT_COL_DTYPES, engine="c",
+        usecols=lambda col: col.strip() in NEEDED_COLS, # callable: toleran spasi di header
+        chunksize=CSV_CHUNK_ROWS,
+    )
+    date_state = {}
+    with reader:
+        return pd.concat([clean_csv_chunk(chunk, date_state) for chunk in reader], ignore_index=True)
+
+def build_monthly_panel(df):
+    """Panel bulanan per (Code, bulan): snapshot kepemilikan akhir bulan + total flow bulan itu.
+
+    Kolom 'Date' berisi awal bulan ('MS'), sehingga helper bulanan (Tab 3 & Tab 4) cukup
+    membaca panel ini, bukan data harian yang jauh lebih besar. Index: Code (terurut).
+    """
+    df_sorted = df.sort_values(['Code', 'Date'], kind='stable')
+    month_start = pd.Series(
+        df_sorted['Date'].to_numpy().astype('datetime64[M]').astype('datetime64[ns]'),
+        index=df_sorted.index, name='Date'
+    )
+    grouped = df_sorted.groupby([df_sorted['Code'], month_start], observed=True, sort=True)
+    panel = grouped[OWNERSHIP_COLS + ['Sector']].last()
+    panel['Total_chg'] = grouped['Total_chg'].sum()
+    panel = panel.reset_index()
+    panel['Year'] = panel['Date'].dt.year.astype('int16')
+    return panel.set_index('Code', drop=False)
 
 @st.cache_data(ttl=3600)
 def load_data():
     """Mencari file KSEI, men-download, membersihkan, dan membacanya ke Pandas."""
-    service, error_msg = get_gdrive_service()
+    service, creds, error_msg = get_gdrive_service()
     if error_msg:
-        return pd.DataFrame(), error_msg, "error"
+        return pd.DataFrame(), pd.DataFrame(), error_msg, "error"
 
     try:
         query = f"'{FOLDER_ID}' in parents and name='{FILE_NAME}' and trashed=false"
         results = service.files().list(
-            q=query, fields="files(id, name)", orderBy="modifiedTime desc", pageSize=1
+            q=query, fields="files(id, name, modifiedTime, md5Checksum, size)",
+            orderBy="modifiedTime desc", pageSize=1
         ).execute()
         items = results.get('files', [])
 
         if not items:
             msg = f"❌ File '{FILE_NAME}' tidak ditemukan di folder GDrive."
-            return pd.DataFrame(), msg, "error"
-
-        file_id = items[0]['id']
-        request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-        fh.seek(0)
-
-        df = pd.read_csv(fh, dtype=object)
-
-        df.columns = df.columns.str.strip()
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+            return pd.DataFrame(), pd.DataFrame(), msg, "error"
+
+        file_meta = items[0]
+        file_id = file_meta['id']
+
+        # Cache disk: skip download + parsing jika versi file belum berubah
+        cache_path, meta_path = get_cache_paths(file_id, file_meta)
+        data_key = os.path.splitext(os.path.basename(cache_path))[0]
+        df = read_disk_cache(cache_path)
+        if df is not None:
+            df.attrs['data_key'] = data_key
+            df.attrs['sector_ok'] = bool(df['Sector'].nunique() > 1)
+            msg = f"Data KSEI berhasil dimuat dari cache lokal (file ID: {file_id})."
+            return df, build_monthly_panel(df), msg, "success"
+
+        file_size = int(file_meta.get('size') or 0)
+        csv_path = None
+        if file_size >= PARALLEL_DOWNLOAD_MIN_BYTES:
+            try:
+                csv_path = download_parallel_to_tempfile(creds, file_id, file_size)
+            except RangeDownloadError:
+                csv_path = None # Range diabaikan proxy/server -> ulang via download serial
+        if csv_path is None:
+            csv_path = download_to_tempfile(service.files().get_media(fileId=file_id))
+        try:
+            try:
+                df = read_csv_arrow(csv_path)
+            except pa.ArrowInvalid:
+                # Tipe kolom berubah di tengah file (mis. angka lalu '1,234') -> parser pandas
+                df = read_csv_pandas(csv_path)
+        finally:
+            os.remove(csv_path)
 
         if 'Sector' in df.columns:
-            df['Sector'] = df['Sector'].astype(str).str.strip().fillna('Others')
+            # fillna SEBELUM astype(str): null Arrow (None) & pandas (NaN) sama-sama jadi 'Others'
+            sector = df['Sector'].fillna('Others').astype(str).str.strip()
+            df['Sector'] = sector.mask(sector == '', 'Others')
         else:
             df['Sector'] = 'Others'
 
-        cols_to_numeric = [
-            'Price', 'Price_Chg %', 'Free Float', 'Total_Local', 'Total_Foreign',
-            'Top_Buyer_Vol', 'Top_Seller_Vol', 'Sec. Num'
-        ] + OWNERSHIP_COLS + OWNERSHIP_CHG_COLS
+        if 'Sec. Num' not in df.columns:
+            st.error("Kolom 'Sec. Num' tidak ditemukan di file CSV.", icon="🚨")
+            df['Sec. Num'] = np.int64(0)
 
-        for col in cols_to_numeric:
+        # Kolom teks berulang -> category (groupby/isin jalan di atas kode integer)
+        for col in TEXT_COL_DTYPES:
             if col in df.columns:
-                cleaned_col = df[col].astype(str).str.strip()
-                cleaned_col = cleaned_col.str.replace(',', '', regex=False)
-                if col == 'Sec. Num' and cleaned_col.eq('').any():
-                    pass
-                df[col] = pd.to_numeric(cleaned_col, errors='coerce').fillna(0)
-            elif col == 'Sec. Num':
-                 st.error("Kolom 'Sec. Num' tidak ditemukan di file CSV.", icon="🚨")
-                 df['Sec. Num'] = 0
-
-        df = df.dropna(subset=['Date', 'Code'])
-
-        local_chg_cols = [col for col in OWNERSHIP_CHG_COLS if 'Local' in col]
-        foreign_chg_cols = [col for col in OWNERSHIP_CHG_COLS if 'Foreign' in col]
-
-        df['Total_Local_chg'] = df[local_chg_cols].sum(axis=1)
-        df['Total_Foreign_chg'] = df[foreign_chg_cols].sum(axis=1)
-        df['Total_chg'] = df['Total_Local_chg'] + df['Total_Foreign_chg']
+                df[col] = df[col].astype('category')
+
+        # Satu materialisasi 18 kolom _chg (Local dulu, lalu Foreign), dibelah per kelompok
+        chg_arr = df[LOCAL_CHG_COLS + FOREIGN_CHG_COLS].to_numpy()
+        n_local = len(LOCAL_CHG_COLS)
+        total_local_chg = chg_arr[:, :n_local].sum(axis=1)
+        total_foreign_chg = chg_arr[:, n_local:].sum(axis=1)
+        df['Total_Local_chg'] = total_local_chg
+        df['Total_Foreign_chg'] = total_foreign_chg
+        df['Total_chg'] = total_local_chg + total_foreign_chg
+
+        # Urut (Date, Top_Buyer_Vol) sekali saat load -> tiap tahun jadi blok kontigu untuk
+        # slice_years, dan screener cukup membalik urutan (tanpa sort per rerun)
+        df = df.sort_values(['Date', 'Top_Buyer_Vol'], ignore_index=True)
+
+        df.attrs['data_key'] = data_key
+        # Sector selalu ada (diisi 'Others'); cukup dicek sekali apakah isinya bermakna
+        df.attrs['sector_ok'] = bool(df['Sector'].nunique() > 1)
+        write_disk_cache(df, cache_path, meta_path, file_meta)
 
         msg = f"Data KSEI berhasil dimuat (file ID: {file_id})."
-        return df, msg, "success"
+        return df, build_monthly_panel(df), msg, "success"
 
     except Exception as e:
+        # Sesi/token Drive bisa kedaluwarsa -> paksa client dibangun ulang pada percobaan berikutnya
+        build_gdrive_service.clear()
         msg = f"❌ Terjadi error saat memuat data KSEI: {e}."
-        return pd.DataFrame(), msg, "error"
-
-# ==============================================================================
-# 🛠️ 4) FUNGSI KALKULASI (untuk Tabs)
-# ==============================================================================
-
-@st.cache_data
-def calculate_macro_flow(df_filtered_by_year):
-    """(TAB 1) Menghitung total aliran dana per kategori di seluruh market."""
-    net_flow = df_filtered_by_year[OWNERSHIP_CHG_COLS].sum().reset_index()
-    net_flow.columns = ['Kategori', 'Total Net Flow (Shares)']
-    net_flow['Kategori'] = net_flow['Kategori'].str.replace('_chg', '')
-    net_flow = net_flow.sort_values(by='Total Net Flow (Shares)', ascending=False)
-
-    cum_flow = df_filtered_by_year.groupby('Date')[['Total_Local_chg', 'Total_Foreign_chg']].sum().cumsum().reset_index()
-    cum_flow = cum_flow.melt('Date', var_name='Kategori', value_name='Cumulative Flow')
-    cum_flow['Kategori'] = cum_flow['Kategori'].str.replace('_chg', ' (Net)')
-
-    return net_flow, cum_flow
-
-@st.cache_data
-def calculate_sector_rotation(df_filtered_by_year, selected_category):
-    """(TAB 2) Menghitung aliran dana bersih kategori tertentu per sektor."""
-    if 'Sector' not in df_filtered_by_year.columns or df_filtered_by_year['Sector'].nunique() <= 1:
-        return pd.DataFrame(), "Data sektor tidak tersedia atau hanya 'Others'."
-    category_chg_col = f"{selected_category}_chg"
-    if category_chg_col not in df_filtered_by_year.columns:
-        return pd.DataFrame(), f"Kolom '{category_chg_col}' tidak ditemukan."
-    sector_category_flow = df_filtered_by_year.groupby('Sector')[category_chg_col].sum().reset_index()
-    sector_category_flow.columns = ['Sector', 'Net Flow (Shares)']
-    sector_category_flow = sector_category_flow.sort_values(by='Net Flow (Shares)', ascending=False)
-    return sector_category_flow, None
-
-@st.cache_data
-def calculate_monthly_sector_flow(df_filtered_by_year):
-    """(TAB 4 Chart) Menghitung total aliran dana bersih bulanan per sektor."""
-    if 'Sector' not in df_filtered_by_year.columns or df_filtered_by_year['Sector'].nunique() <= 1:
-        return pd.DataFrame(), "Data sektor tidak tersedia."
-    df_temp = df_filtered_by_year.set_index('Date')
-    monthly_sector_flow = df_temp.groupby('Sector').resample('MS')['Total_chg'].sum().reset_index()
-    monthly_sector_flow.columns = ['Sector', 'Month', 'Net Flow (Shares)']
-    return monthly_sector_flow, None
-
-@st.cache_data
-def get_stock_ownership_state(df, stock_code):
-    """(TAB 3 Pie) Mengambil data kepemilikan TERBARU untuk 1 saham."""
-    df_stock = df[df['Code'] == stock_code]
-    if df_stock.empty:
-        return pd.DataFrame(), pd.Series(dtype='object')
-
-    latest_row = df_stock.sort_values('Date').iloc[-1]
-    df_state = latest_row[OWNERSHIP_COLS].reset_index()
-    df_state.columns = ['Kategori', 'Jumlah Saham']
-
-    total_shares_pie1 = df_state['Jumlah Saham'].sum()
-    if total_shares_pie1 > 0:
-        df_state['Persentase'] = (df_state['Jumlah Saham'] / total_shares_pie1) * 100
-    else:
-        df_state['Persentase'] = 0
-
-    return df_state.sort_values(by='Jumlah Saham', ascending=False), latest_row
-
-@st.cache_data
-def calculate_monthly_shareholder_change_table(df_stock_filtered):
-    """(TAB 3 Table) Menghitung perubahan bulanan per kategori shareholder."""
-    if df_stock_filtered.empty:
-        return pd.DataFrame()
-    df_temp = df_stock_filtered.set_index('Date')
-    # Resample per bulan (Month Start 'MS'), ambil LAST (data terakhir bulan itu)
-    # Ini memberi kita snapshot kepemilikan akhir bulan
-    monthly_snapshot = df_temp.resample('MS')[OWNERSHIP_COLS].last()
-
-    # Hitung perubahan dari bulan sebelumnya (.diff)
-    monthly_changes = monthly_snapshot.diff().fillna(0) # Isi NaN di bulan pertama dengan 0
-
-    # Pastikan index adalah datetime
-    monthly_changes.index = pd.to_datetime(monthly_changes.index)
-
-    monthly_changes = monthly_changes.sort_index(ascending=False)
-    monthly_changes = monthly_changes.reset_index()
-    monthly_changes.rename(columns={'Date': 'Month'}, inplace=True)
-    return monthly_changes
-
-
-# [PERUBAHAN] Fungsi untuk line chart histori kepemilikan (REAL)
-@st.cache_data
-def calculate_historical_ownership_raw(df_stock_filtered):
-    """(TAB 3 Line Chart) Mengambil data kepemilikan historis (jumlah saham) per kategori."""
-    if df_stock_filtered.empty or not all(col in df_stock_filtered.columns for col in OWNERSHIP_COLS):
-        return pd.DataFrame()
-
-    # Pilih kolom yang relevan
-    df_hist_raw = df_stock_filtered[['Date'] + OWNERSHIP_COLS].copy()
-
-    # Melt untuk format plotting
-    df_melted = df_hist_raw.melt(id_vars=['Date'], var_name='Kategori', value_name='Jumlah Saham')
-
-    # Filter kategori yang selalu 0
-    total_shares_per_cat = df_melted.groupby('Kategori')['Jumlah Saham'].sum()
-    active_categories = total_shares_per_cat[total_shares_per_cat != 0].index
-    df_melted = df_melted[df_melted['Kategori'].isin(active_categories)]
-
-    return df_melted.sort_values(by=['Date', 'Kategori'])
-
-
-def highlight_max_min(s):
-    '''Highlight maximum (positive) in green and minimum (negative) in red.'''
-    s_numeric = pd.to_numeric(s, errors='coerce')
-    max_val = s_numeric[s_numeric > 0].max()
-    min_val = s_numeric[s_numeric < 0].min()
-    colors = []
-    for val in s_numeric:
-        if pd.notna(val):
-            if val == max_val and val > 0:
-                colors.append('background-color: lightgreen')
-            elif val == min_val and val < 0:
-                colors.append('background-color: lightcoral')
-            else:
-                colors.append('')
-        else:
-             colors.append('')
-    return colors
-
+        return pd.DataFrame(), pd.DataFrame(), msg, "error"
 
 # ==============================================================================
-# 💎 5) LAYOUT UTAMA (HEADER)
+# 💎 4) LAYOUT UTAMA (HEADER)
 # ==============================================================================
 st.title("🌊 Dashboard Analisis Aliran Dana KSEI")
 st.caption("Menganalisis rotasi kepemilikan saham (flow) untuk mengambil keputusan.")
 
-df, status_msg, status_level = load_data()
+df, df_monthly_panel, status_msg, status_level = load_data()
+data_key = df.attrs.get('data_key', '')
 
 if status_level == "success":
     st.toast(status_msg, icon="✅")
@@ -255,19 +429,44 @@ elif status_level == "error":
     st.error(status_msg)
 
 # ==============================================================================
-# 🧭 6) SIDEBAR FILTER
+# 🧭 5) SIDEBAR FILTER
 # ==============================================================================
+# Navigasi pengganti st.tabs: st.tabs mengeksekusi SEMUA tab setiap rerun,
+# radio cukup menjalankan kalkulasi & chart untuk tampilan yang dipilih saja.
+TAB_MAKRO = "🌊 **Makro (Market)**"
+TAB_SEKTOR = "📊 **Analisis Sektor (Rotasi)**"
+TAB_INDIVIDUAL = "📈 **Analisa Individual**"
+TAB_SCREENER = "🔍 **Screener Rotasi**"
+active_tab = st.sidebar.radio(
+    "🧭 Tampilan",
+    [TAB_MAKRO, TAB_SEKTOR, TAB_INDIVIDUAL, TAB_SCREENER],
+    key="tab"
+)
+
 st.sidebar.header("🎛️ Filter Analisis")
 
 if st.sidebar.button("🔄 Refresh Data (Tarik Ulang dari GDrive)"):
     load_data.clear()
+    build_gdrive_service.clear() # Ambil ulang secrets (rotasi credentials)
+    slice_years.clear()
+    unique_years.clear()
+    unique_codes_for_years.clear()
     # [PERUBAHAN] Clear cache fungsi kalkulasi juga saat refresh
+    compute_flow_cube.clear()
     calculate_macro_flow.clear()
     calculate_sector_rotation.clear()
     calculate_monthly_sector_flow.clear()
+    index_by_code.clear()
+    stock_rows_for_years.clear()
+    compute_latest_rows.clear()
     get_stock_ownership_state.clear()
     calculate_monthly_shareholder_change_table.clear()
     calculate_historical_ownership_raw.clear() # Clear cache fungsi baru
+    macro_cum_flow_figure.clear()
+    flow_bars_figure.clear()
+    ownership_pies_figure.clear()
+    historical_ownership_figure.clear()
+    monthly_sector_flow_figure.clear()
     st.rerun()
 
 if df.empty:
@@ -275,8 +474,8 @@ if df.empty:
     st.stop()
 
 # Filter Utama: TAHUN
-all_years = sorted(df['Date'].dt.year.unique(), reverse=True)
-max_year = df['Date'].dt.year.max()
+all_years = unique_years(df, data_key)
+max_year = all_years[0]
 
 selected_years = st.sidebar.multiselect(
     "Pilih Tahun Analisis",
@@ -288,29 +487,31 @@ if not selected_years:
     st.sidebar.warning("Pilih minimal satu tahun.")
     selected_years = [max_year]
 
-df_filtered_by_year = df[df['Date'].dt.year.isin(selected_years)].copy()
+years_key = tuple(sorted(selected_years))
+df_filtered_by_year = slice_years(df, data_key, years_key)
 st.caption(f"Menampilkan data untuk tahun: **{', '.join(map(str, selected_years))}**")
+df_by_code = index_by_code(df, data_key)
+latest_rows = compute_latest_rows(df, data_key)
 
 # Filter untuk Tab 4 (Screener)
 st.sidebar.header("Filter Screener (u/ Tab 4)") # Nomor Tab diupdate
 
-all_stocks = sorted(df_filtered_by_year['Code'].unique())
+all_stocks = unique_codes_for_years(df, data_key, years_key)
 selected_stocks = st.sidebar.multiselect(
     "Filter Saham:",
     all_stocks,
     placeholder="Ketik kode saham"
 )
 
-all_categories_base = [col.replace('_chg', '') for col in OWNERSHIP_CHG_COLS]
 selected_buyers = st.sidebar.multiselect(
     "Filter Top Buyer:",
-    sorted(all_categories_base),
+    ALL_CATEGORIES_SORTED,
     placeholder="Cari pergerakan oleh..."
 )
 
 selected_sellers = st.sidebar.multiselect(
     "Filter Top Seller:",
-    sorted(all_categories_base),
+    ALL_CATEGORIES_SORTED,
     placeholder="Cari pergerakan oleh..."
 )
 
@@ -321,172 +522,67 @@ min_rotation_vol = st.sidebar.number_input(
     step=100000
 )
 
-# Terapkan Filter (hanya untuk screener)
-df_screener_filtered = df_filtered_by_year.copy()
-
-if selected_stocks:
-    df_screener_filtered = df_screener_filtered[df_screener_filtered['Code'].isin(selected_stocks)]
-if selected_buyers:
-    df_screener_filtered = df_screener_filtered[df_screener_filtered['Top_Buyer'].isin(selected_buyers)]
-if selected_sellers:
-    df_screener_filtered = df_screener_filtered[df_screener_filtered['Top_Seller'].isin(selected_sellers)]
-if min_rotation_vol > 0:
-    df_screener_filtered = df_screener_filtered[
-        (df_screener_filtered['Top_Buyer_Vol'] >= min_rotation_vol) |
-        (df_screener_filtered['Top_Seller_Vol'].abs() >= min_rotation_vol)
-    ]
-
-# ==============================================================================
-#  LAYOUT UTAMA (DENGAN 4 TABS BARU)
-# ==============================================================================
-
-tab1, tab2, tab3, tab4 = st.tabs([
-    "🌊 **Makro (Market)**",
-    "📊 **Analisis Sektor (Rotasi)**",
-    "📈 **Analisa Individual**", # Nama Tab diubah
-    "🔍 **Screener Rotasi**"
-])
-
-# --- TAB 1: RINGKASAN ALIRAN DANA (MARKET) ---
-with tab1:
-    # ... (Kode Tab 1 tidak berubah) ...
-    st.subheader(f"Peta Aliran Dana Market (Tahun: {', '.join(map(str, selected_years))})")
-    df_net_flow, df_cum_flow = calculate_macro_flow(df_filtered_by_year)
-    st.markdown("**Aliran Dana Kumulatif (Lokal vs Asing)**")
-    fig_macro = px.line(df_cum_flow, x='Date', y='Cumulative Flow', color='Kategori', title='Aliran Kumulatif Lokal vs Asing (Total Market)', labels={'Cumulative Flow': 'Total Saham (Kumulatif)', 'Date': 'Tanggal'})
-    fig_macro.update_traces(hovertemplate='Tanggal: %{x|%d %b %Y}<br>Flow: %{y:,.0f}<extra></extra>')
-    fig_macro.update_layout(hovermode="x unified")
-    st.plotly_chart(fig_macro, use_container_width=True)
-    st.markdown("---")
-    st.markdown("**Kategori Investor Terkuat (Net Flow)**")
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("**Top 5 Kategori Net Buy**")
-        top_5_buy = df_net_flow.head(5)
-        fig_buy = px.bar(top_5_buy, x='Total Net Flow (Shares)', y='Kategori', orientation='h', text='Total Net Flow (Shares)')
-        fig_buy.update_layout(yaxis={'categoryorder':'total ascending'})
-        fig_buy.update_traces(texttemplate='%{x:,.0f}', textposition='outside', marker_color='green', hovertemplate='Kategori: %{y}<br>Net Flow: %{x:,.0f}<extra></extra>')
-        st.plotly_chart(fig_buy, use_container_width=True)
-    with col2:
-        st.markdown("**Top 5 Kategori Net Sell**")
-        top_5_sell = df_net_flow.tail(5).sort_values(by='Total Net Flow (Shares)')
-        fig_sell = px.bar(top_5_sell, x='Total Net Flow (Shares)', y='Kategori', orientation='h', text='Total Net Flow (Shares)')
-        fig_sell.update_layout(yaxis={'categoryorder':'total descending'})
-        fig_sell.update_traces(texttemplate='%{x:,.0f}', textposition='outside', marker_color='red', hovertemplate='Kategori: %{y}<br>Net Flow: %{x:,.0f}<extra></extra>')
-        st.plotly_chart(fig_sell, use_container_width=True)
-
-
-# --- TAB 2: ANALISIS SEKTOR (ROTASI) ---
-with tab2:
-    # ... (Kode Tab 2 tidak berubah) ...
-    st.subheader(f"Analisis Rotasi Kategori Investor per Sektor (Tahun: {', '.join(map(str, selected_years))})")
-    if 'Sector' not in df_filtered_by_year.columns or df_filtered_by_year['Sector'].nunique() <= 1:
-        st.warning("Kolom 'Sector' tidak ditemukan atau hanya berisi 'Others'.")
-    else:
-        all_categories_for_sector = sorted([col.replace('_chg', '') for col in OWNERSHIP_CHG_COLS])
-        selected_category_for_sector = st.selectbox("Pilih Kategori Investor:", all_categories_for_sector, key="sector_category_select")
-        if selected_category_for_sector:
-            df_sector_cat_flow, error_sec_cat = calculate_sector_rotation(df_filtered_by_year, selected_category_for_sector)
-            if error_sec_cat: st.error(error_sec_cat)
-            elif not df_sector_cat_flow.empty:
-                st.markdown(f"**Net Flow ({selected_category_for_sector}) per Sektor**")
-                col_sec_1, col_sec_2 = st.columns(2)
-                with col_sec_1:
-                    st.markdown(f"**Top 10 Sektor Net Buy**")
-                    top_buy_sectors = df_sector_cat_flow[df_sector_cat_flow['Net Flow (Shares)'] > 0].head(10)
-                    if not top_buy_sectors.empty:
-                        fig_sec_buy = px.bar(top_buy_sectors, x='Net Flow (Shares)', y='Sector', orientation='h', text='Net Flow (Shares)', color_discrete_sequence=['green'])
-                        fig_sec_buy.update_layout(yaxis={'categoryorder':'total ascending'})
-                        fig_sec_buy.update_traces(texttemplate='%{x:,.0f}', textposition='outside', hovertemplate='Sektor: %{y}<br>Net Flow: %{x:,.0f}<extra></extra>')
-                        st.plotly_chart(fig_sec_buy, use_container_width=True)
-                    else: st.info(f"Tidak ada net buy signifikan.")
-                with col_sec_2:
-                    st.markdown(f"**Top 10 Sektor Net Sell**")
-                    top_sell_sectors = df_sector_cat_flow[df_sector_cat_flow['Net Flow (Shares)'] < 0].tail(10).sort_values(by='Net Flow (Shares)')
-                    if not top_sell_sectors.empty:
-                        fig_sec_sell = px.bar(top_sell_sectors, x='Net Flow (Shares)', y='Sector', orientation='h', text='Net Flow (Shares)', color_discrete_sequence=['red'])
-                        fig_sec_sell.update_layout(yaxis={'categoryorder':'total descending'})
-                        fig_sec_sell.update_traces(texttemplate='%{x:,.0f}', textposition='outside', hovertemplate='Sektor: %{y}<br>Net Flow: %{x:,.0f}<extra></extra>')
-                        st.plotly_chart(fig_sec_sell, use_container_width=True)
-                    else: st.info(f"Tidak ada net sell signifikan.")
-            else: st.info("Tidak ada data aliran dana.")
-
-# --- TAB 3: ANALISA INDIVIDUAL ---
-with tab3:
+# --- TAB 3: ANALISA INDIVIDUAL (fragment) ---
+# Ganti saham di selectbox hanya me-rerun fragment ini: sidebar, filter tahun & tab lain
+# tidak dieksekusi ulang. Argumen disimpan Streamlit untuk rerun fragment berikutnya.
+@st.fragment
+def render_individual_analysis(df, df_by_code, df_monthly_panel, latest_rows, data_key, years_key):
+    """(TAB 3) Analisa kepemilikan satu saham."""
     st.subheader("Bagaimana Aliran Dana di Satu Saham?")
-    stocks_in_period = sorted(df_filtered_by_year['Code'].unique())
+    stocks_in_period = unique_codes_for_years(df, data_key, years_key)
     stock_to_analyze = st.selectbox("Pilih Saham:", stocks_in_period, index=stocks_in_period.index("BBCA") if "BBCA" in stocks_in_period else 0, key="selectbox_stock_analysis")
 
     if stock_to_analyze:
-        df_stock_filtered = df_filtered_by_year[df_filtered_by_year['Code'] == stock_to_analyze].sort_values('Date')
-        df_state, latest_row_data = get_stock_ownership_state(df, stock_to_analyze)
+        df_stock_filtered = stock_rows_for_years(df_by_code, data_key, 'daily', stock_to_analyze, years_key)
+        df_state, latest_row_data = get_stock_ownership_state(latest_rows, data_key, stock_to_analyze)
 
         if df_stock_filtered.empty or df_state.empty:
             st.warning(f"Tidak ada data untuk {stock_to_analyze} pada tahun terpilih.")
         else:
-            latest_price = latest_row_data.get('Price', np.nan)
-            free_float = latest_row_data.get('Free Float', np.nan)
-            stock_sector = latest_row_data.get('Sector', 'N/A')
-            sec_num = latest_row_data.get('Sec. Num', 0)
-            total_local = latest_row_data.get('Total_Local', 0)
-            total_foreign = latest_row_data.get('Total_Foreign', 0)
+            # Satu reindex untuk semua info header (bukan 6x lookup label); kolom hilang -> NaN
+            latest_price, free_float, stock_sector, sec_num, total_local, total_foreign = latest_row_data.reindex(
+                ['Price', 'Free Float', 'Sector', 'Sec. Num', 'Total_Local', 'Total_Foreign'])
+            if pd.isna(stock_sector): stock_sector = 'N/A'
 
             st.markdown(f"**Analisis: {stock_to_analyze} ({stock_sector})**")
             col1, col2, col3 = st.columns(3)
             col1.metric("Harga Terakhir", f"Rp {latest_price:,.0f}" if pd.notna(latest_price) else "N/A")
             col2.metric("Free Float Saham", f"{free_float:.2f}%" if pd.notna(free_float) else "N/A")
-            col3.metric("Sektor", stock_sector if pd.notna(stock_sector) else "N/A")
+            col3.metric("Sektor", stock_sector)
             st.markdown("---")
 
             # --- [PERUBAHAN] Layout Pie Charts di Atas ---
             st.markdown("**Peta Kepemilikan (Terbaru)**")
-            pcol1, pcol2 = st.columns(2) # Dua kolom untuk Pie Charts
-
-            with pcol1:
-                # Pie Chart 1: All Categories
-                if not df_state.empty and df_state['Jumlah Saham'].sum() > 0:
-                    fig_pie_all = px.pie(
-                        df_state, names='Kategori', values='Jumlah Saham',
-                        title=f'Komposisi Semua Holder', hole=0.3 )
-                    fig_pie_all.update_traces(textinfo='percent+label', texttemplate='%{label}(%{percent})', sort=False, showlegend=False)
-                    fig_pie_all.update_layout(margin=dict(l=20, r=20, t=30, b=20))
-                    st.plotly_chart(fig_pie_all, use_container_width=True)
-                else: st.info("No ownership data.")
-
-            with pcol2:
-                # Pie Chart 2: Local / Foreign / Non-FF
-                if sec_num > 0:
-                    non_free_float_val = max(0, sec_num - total_local - total_foreign)
-                    df_pie_dist = pd.DataFrame({'Tipe': ['Lokal', 'Asing', 'Non Publik'],
-                                                'Jumlah Saham': [total_local, total_foreign, non_free_float_val]})
-                    df_pie_dist = df_pie_dist[df_pie_dist['Jumlah Saham'] > 0]
-                    if not df_pie_dist.empty:
-                        fig_pie_dist = px.pie(
-                            df_pie_dist, names='Tipe', values='Jumlah Saham',
-                            title=f'Distribusi Umum', hole=0.3 )
-                        fig_pie_dist.update_traces(textinfo='percent+label', texttemplate='%{label}(%{percent})', sort=False, showlegend=False)
-                        fig_pie_dist.update_layout(margin=dict(l=20, r=20, t=30, b=20))
-                        st.plotly_chart(fig_pie_dist, use_container_width=True)
-                    else: st.info("No distribution data.")
-                else: st.warning("'Sec. Num' invalid.")
+            pies = [] # (judul, labels, values) -> digabung jadi satu figure subplot
+
+            # Pie Chart 1: All Categories
+            if not df_state.empty and df_state['Jumlah Saham'].sum() > 0:
+                pies.append(('Komposisi Semua Holder', df_state['Kategori'], df_state['Jumlah Saham']))
+            else: st.info("No ownership data.")
+
+            # Pie Chart 2: Local / Foreign / Non-FF
+            if sec_num > 0:
+                non_free_float_val = max(0, sec_num - total_local - total_foreign)
+                df_pie_dist = pd.DataFrame({'Tipe': ['Lokal', 'Asing', 'Non Publik'],
+                                            'Jumlah Saham': [total_local, total_foreign, non_free_float_val]})
+                df_pie_dist = df_pie_dist[df_pie_dist['Jumlah Saham'] > 0]
+                if not df_pie_dist.empty:
+                    pies.append(('Distribusi Umum', df_pie_dist['Tipe'], df_pie_dist['Jumlah Saham']))
+                else: st.info("No distribution data.")
+            else: st.warning("'Sec. Num' invalid.")
+
+            if pies:
+                fig_pies = ownership_pies_figure(pies, data_key, stock_to_analyze)
+                # Key tetap per slot chart -> elemen dipakai ulang saat saham/filter berganti
+                st.plotly_chart(fig_pies, use_container_width=True, key="stock_pies")
 
             # --- [PERUBAHAN] Line Chart di Bawah Pie Charts ---
             st.markdown("**Tren Kepemilikan Historis (Jumlah Saham)**") # Judul diubah
             # Panggil fungsi baru (real numbers)
-            df_hist_raw = calculate_historical_ownership_raw(df_stock_filtered)
+            df_hist_raw = calculate_historical_ownership_raw(df_stock_filtered, data_key, stock_to_analyze, years_key)
             if not df_hist_raw.empty:
-                fig_hist_raw = px.line(
-                    df_hist_raw,
-                    x='Date',
-                    y='Jumlah Saham', # Data diubah ke Jumlah Saham
-                    color='Kategori',
-                    title=f'Tren Jumlah Kepemilikan {stock_to_analyze}',
-                    labels={'Date': 'Tanggal', 'Jumlah Saham': 'Jumlah Saham'} # Label diubah
-                )
-                fig_hist_raw.update_layout(hovermode='x unified', yaxis_tickformat=',.0f') # Format koma di sumbu Y
-                # Hover template diubah ke Jumlah Saham
-                fig_hist_raw.update_traces(hovertemplate='Tgl: %{x|%d%b%y}<br>%{fullData.name}: %{y:,.0f}<extra></extra>')
-                st.plotly_chart(fig_hist_raw, use_container_width=True)
+                fig_hist_raw = historical_ownership_figure(df_hist_raw, data_key, stock_to_analyze, years_key)
+                st.plotly_chart(fig_hist_raw, use_container_width=True, key="stock_history")
             else:
                 st.warning("Tidak ada data historis kepemilikan untuk ditampilkan.")
 
@@ -494,15 +590,17 @@ with tab3:
             st.markdown("---")
             # Tabel Detail Bulanan (Layout tidak berubah, tetap di bawah)
             st.markdown("**Detail Rotasi Kepemilikan per Bulan**")
-            df_monthly_change = calculate_monthly_shareholder_change_table(df_stock_filtered)
+            df_stock_monthly = stock_rows_for_years(df_monthly_panel, data_key, 'monthly', stock_to_analyze, years_key)
+            df_monthly_change = calculate_monthly_shareholder_change_table(df_stock_monthly, data_key, stock_to_analyze, years_key)
 
             if not df_monthly_change.empty:
-                df_display_monthly = df_monthly_change.copy()
+                # st.cache_data sudah mengembalikan salinan baru tiap pemanggilan -> aman diubah langsung
+                df_display_monthly = df_monthly_change
                 df_display_monthly['Month'] = df_display_monthly['Month'].dt.strftime('%b %Y')
                 numeric_cols_to_style = df_display_monthly.columns.drop('Month')
 
                 st.dataframe(
-                    df_display_monthly.style.apply(highlight_max_min, subset=numeric_cols_to_style, axis=1)
+                    df_display_monthly.style.apply(highlight_max_min, subset=numeric_cols_to_style, axis=None)
                                           .format("{:,.0f}", subset=numeric_cols_to_style, na_rep='0'),
                     use_container_width=True, # Tetap full width
                     hide_index=True
@@ -511,40 +609,121 @@ with tab3:
                 st.warning("Tidak ada data perubahan bulanan untuk ditampilkan.")
 
 
+# ==============================================================================
+#  LAYOUT UTAMA (HANYA TAMPILAN AKTIF YANG DIEKSEKUSI)
+# ==============================================================================
+
+# --- TAB 1: RINGKASAN ALIRAN DANA (MARKET) ---
+if active_tab == TAB_MAKRO:
+    # ... (Kode Tab 1 tidak berubah) ...
+    st.subheader(f"Peta Aliran Dana Market (Tahun: {', '.join(map(str, selected_years))})")
+    df_net_flow, df_cum_flow = calculate_macro_flow(df, data_key, years_key)
+    st.markdown("**Aliran Dana Kumulatif (Lokal vs Asing)**")
+    fig_macro = macro_cum_flow_figure(df_cum_flow, data_key, years_key)
+    st.plotly_chart(fig_macro, use_container_width=True, key="macro_cum")
+    st.markdown("---")
+    st.markdown("**Kategori Investor Terkuat (Net Flow)**")
+    # Net buy & net sell = dua subplot dalam satu figure -> satu payload JSON
+    top_5_buy = df_net_flow.nlargest(5, 'Total Net Flow (Shares)')
+    top_5_sell = df_net_flow.nsmallest(5, 'Total Net Flow (Shares)')
+    sides = [('Top 5 Kategori Net Buy', top_5_buy, 'green', 'total ascending'),
+             ('Top 5 Kategori Net Sell', top_5_sell, 'red', 'total descending')]
+    fig_macro_bars = flow_bars_figure(sides, (data_key, years_key, 'macro'), 'Total Net Flow (Shares)', 'Kategori', 'Kategori')
+    st.plotly_chart(fig_macro_bars, use_container_width=True, key="macro_bars")
+
+
+# --- TAB 2: ANALISIS SEKTOR (ROTASI) ---
+elif active_tab == TAB_SEKTOR:
+    # ... (Kode Tab 2 tidak berubah) ...
+    st.subheader(f"Analisis Rotasi Kategori Investor per Sektor (Tahun: {', '.join(map(str, selected_years))})")
+    if not df.attrs.get('sector_ok', False):
+        st.warning("Kolom 'Sector' tidak ditemukan atau hanya berisi 'Others'.")
+    else:
+        selected_category_for_sector = st.selectbox("Pilih Kategori Investor:", ALL_CATEGORIES_SORTED, key="sector_category_select")
+        if selected_category_for_sector:
+            df_sector_cat_flow, error_sec_cat = calculate_sector_rotation(df, data_key, years_key, selected_category_for_sector)
+            if error_sec_cat: st.error(error_sec_cat)
+            elif not df_sector_cat_flow.empty:
+                st.markdown(f"**Net Flow ({selected_category_for_sector}) per Sektor**")
+                sides = [] # (judul, df_top, warna, categoryorder) -> digabung jadi satu figure subplot
+                top_buy_sectors = df_sector_cat_flow[df_sector_cat_flow['Net Flow (Shares)'] > 0].nlargest(10, 'Net Flow (Shares)')
+                if not top_buy_sectors.empty:
+                    sides.append(('Top 10 Sektor Net Buy', top_buy_sectors, 'green', 'total ascending'))
+                else: st.info(f"Tidak ada net buy signifikan.")
+                top_sell_sectors = df_sector_cat_flow[df_sector_cat_flow['Net Flow (Shares)'] < 0].nsmallest(10, 'Net Flow (Shares)')
+                if not top_sell_sectors.empty:
+                    sides.append(('Top 10 Sektor Net Sell', top_sell_sectors, 'red', 'total descending'))
+                else: st.info(f"Tidak ada net sell signifikan.")
+                if sides:
+                    fig_sector_bars = flow_bars_figure(sides, (data_key, years_key, selected_category_for_sector, 'sector'), 'Net Flow (Shares)', 'Sector', 'Sektor')
+                    st.plotly_chart(fig_sector_bars, use_container_width=True, key="sector_bars")
+            else: st.info("Tidak ada data aliran dana.")
+
+# --- TAB 3: ANALISA INDIVIDUAL ---
+elif active_tab == TAB_INDIVIDUAL:
+    render_individual_analysis(df, df_by_code, df_monthly_panel, latest_rows, data_key, years_key)
+
+
 # --- TAB 4: SCREENER ROTASI ---
-with tab4:
+elif active_tab == TAB_SCREENER:
     # ... (Kode Tab 4 tidak berubah) ...
     st.subheader("Screener Rotasi Kepemilikan")
     st.markdown("**Tren Aliran Dana Bersih Bulanan per Sektor**")
-    df_monthly_sec_flow, error_monthly_sec = calculate_monthly_sector_flow(df_filtered_by_year)
+    # Top 10 sektor (total |flow|) sudah dipilih di dalam agregasi
+    df_monthly_sec_flow_top, error_monthly_sec = calculate_monthly_sector_flow(df_monthly_panel, data_key, years_key, top_n=10)
     if error_monthly_sec: st.warning(error_monthly_sec)
-    elif not df_monthly_sec_flow.empty:
-        total_abs_flow = df_monthly_sec_flow.groupby('Sector')['Net Flow (Shares)'].apply(lambda x: x.abs().sum()).nlargest(10).index
-        df_monthly_sec_flow_top = df_monthly_sec_flow[df_monthly_sec_flow['Sector'].isin(total_abs_flow)]
-        fig_monthly_sec = px.line(df_monthly_sec_flow_top, x='Month', y='Net Flow (Shares)', color='Sector', title='Tren Aliran Dana Bersih Bulanan (Top 10 Sektor)', labels={'Month': 'Bulan', 'Net Flow (Shares)': 'Net Flow Bulanan (Saham)'}, markers=True)
-        fig_monthly_sec.update_layout(hovermode='x unified')
-        fig_monthly_sec.update_traces(hovertemplate='Bulan: %{x|%b %Y}<br>Sektor: %{fullData.name}<br>Flow: %{y:,.0f}<extra></extra>')
-        st.plotly_chart(fig_monthly_sec, use_container_width=True)
+    elif not df_monthly_sec_flow_top.empty:
+        fig_monthly_sec = monthly_sector_flow_figure(df_monthly_sec_flow_top, data_key, years_key)
+        st.plotly_chart(fig_monthly_sec, use_container_width=True, key="monthly_sector")
     else: st.info("Tidak ada data aliran dana sektoral bulanan.")
 
     st.markdown("---")
     st.info("Gunakan filter di sidebar (Filter Tahun & Filter Screener) untuk mencari rotasi spesifik di tabel bawah.")
+
     cols_to_display = ['Date', 'Code', 'Sector', 'Top_Buyer', 'Top_Buyer_Vol', 'Top_Seller', 'Top_Seller_Vol', 'Price', 'Price_Chg %', 'Free Float']
     use_cols = cols_to_display[:]
-    if 'Sector' not in df_screener_filtered.columns:
+    if 'Sector' not in df_filtered_by_year.columns:
         st.warning("Kolom 'Sector' tidak ditemukan untuk screener.")
         use_cols.remove('Sector')
-    df_screener = df_screener_filtered[use_cols].sort_values(by=['Date', 'Top_Buyer_Vol'], ascending=[False, False])
-    df_screener_display = df_screener.copy()
-    df_screener_display['Top_Buyer_Vol'] = df_screener_display['Top_Buyer_Vol'].apply(lambda x: f"{x:,.0f}" if pd.notna(x) else 'N/A')
-    df_screener_display['Top_Seller_Vol'] = df_screener_display['Top_Seller_Vol'].apply(lambda x: f"{x:,.0f}" if pd.notna(x) else 'N/A')
-    df_screener_display['Price'] = df_screener_display['Price'].apply(lambda x: f"Rp {x:,.0f}" if pd.notna(x) else 'N/A')
+
+    # Terapkan Filter (hanya untuk screener) -> satu boolean mask, satu kali slicing
+    screener_mask = np.ones(len(df_filtered_by_year), dtype=bool)
+
+    if selected_stocks:
+        screener_mask &= df_filtered_by_year['Code'].isin(selected_stocks).to_numpy()
+    if selected_buyers:
+        screener_mask &= df_filtered_by_year['Top_Buyer'].isin(selected_buyers).to_numpy()
+    if selected_sellers:
+        screener_mask &= df_filtered_by_year['Top_Seller'].isin(selected_sellers).to_numpy()
+    if min_rotation_vol > 0:
+        buyer_vol = df_filtered_by_year['Top_Buyer_Vol'].to_numpy()
+        seller_vol = np.abs(df_filtered_by_year['Top_Seller_Vol'].to_numpy())
+        screener_mask &= (buyer_vol >= min_rotation_vol) | (seller_vol >= min_rotation_vol)
+
+    # Data sudah terurut (Date, Top_Buyer_Vol) naik sejak load -> posisi dibalik = terbaru & volume terbesar dulu
+    row_pos = np.flatnonzero(screener_mask)[::-1]
+    n_match = row_pos.size
+    show_all = False
+    if n_match > SCREENER_MAX_ROWS and n_match <= SCREENER_SHOW_ALL_LIMIT:
+        show_all = st.checkbox(f"Tampilkan semua ({n_match:,} baris)", key="screener_show_all")
+    if not show_all:
+        # Hanya N baris teratas yang dikirim ke browser (serialisasi Arrow per rerun)
+        row_pos = row_pos[:SCREENER_MAX_ROWS]
+    if n_match > len(row_pos):
+        st.caption(f"Menampilkan {len(row_pos):,} dari {n_match:,} baris (terbaru & volume buyer terbesar dulu).")
+
+    # Baris + kolom tampilan dipilih dalam satu iloc -> hanya kolom tabel yang di-materialize
+    use_col_pos = df_filtered_by_year.columns.get_indexer(use_cols)
+    df_screener = df_filtered_by_year.iloc[row_pos, use_col_pos]
+    # Format angka dilakukan client-side oleh column_config (kolom tetap numerik & bisa di-sort)
     col_config_screener = {
         "Date": st.column_config.DateColumn("Tanggal", format="DD-MM-YYYY"), "Code": "Saham",
-        "Top_Buyer": "Top Buyer", "Top_Buyer_Vol": "Vol Buyer", "Top_Seller": "Top Seller", "Top_Seller_Vol": "Vol Seller",
-        "Price": "Harga", "Price_Chg %": st.column_config.NumberColumn("Change %", format="%.2f%%"),
+        "Top_Buyer": "Top Buyer", "Top_Buyer_Vol": st.column_config.NumberColumn("Vol Buyer", format="localized"),
+        "Top_Seller": "Top Seller", "Top_Seller_Vol": st.column_config.NumberColumn("Vol Seller", format="localized"),
+        "Price": st.column_config.NumberColumn("Harga (Rp)", format="localized"),
+        "Price_Chg %": st.column_config.NumberColumn("Change %", format="%.2f%%"),
         "Free Float": st.column_config.NumberColumn("Free Float %", format="%.2f%%")
     }
     if 'Sector' in use_cols: col_config_screener["Sector"] = "Sektor"
-    st.dataframe(df_screener_display, use_container_width=True, hide_index=True, column_config=col_config_screener)
+    st.dataframe(df_screener, use_container_width=True, hide_index=True, column_config=col_config_screener)
 
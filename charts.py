@@ -0,0 +1,76 @@
+# ==============================================================================
+# 📊 FUNGSI FIGURE PLOTLY (untuk Tabs)
+# ==============================================================================
+# Konstruksi + validasi figure Plotly dibayar ulang di setiap rerun Streamlit. Figure
+# untuk input yang sama disimpan sebagai resource (tanpa pickle) dan dipakai ulang;
+# frame input `_df_*` tidak di-hash, kunci cache = data_key + parameter filter.
+import streamlit as st
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+@st.cache_resource(max_entries=16)
+def macro_cum_flow_figure(_df_cum_flow, data_key, years):
+    """(TAB 1) Line chart aliran kumulatif Lokal vs Asing."""
+    fig = px.line(_df_cum_flow, x='Date', y='Cumulative Flow', color='Kategori', title='Aliran Kumulatif Lokal vs Asing (Total Market)', labels={'Cumulative Flow': 'Total Saham (Kumulatif)', 'Date': 'Tanggal'}, render_mode='webgl')
+    fig.update_traces(hovertemplate='Tanggal: %{x|%d %b %Y}<br>Flow: %{y:,.0f}<extra></extra>')
+    fig.update_layout(hovermode="x unified")
+    return fig
+
+@st.cache_resource(max_entries=32)
+def flow_bars_figure(_sides, cache_key, x_col, y_col, hover_label):
+    """(TAB 1 & 2) Bar horizontal top net buy & net sell berdampingan dalam SATU figure.
+
+    `_sides` = list (judul, df_top, warna, categoryorder); isinya ditentukan penuh oleh `cache_key`.
+    """
+    fig = make_subplots(rows=1, cols=len(_sides), subplot_titles=[title for title, _, _, _ in _sides],
+                        horizontal_spacing=0.2)
+    hovertemplate = f'{hover_label}: %{{y}}<br>Net Flow: %{{x:,.0f}}<extra></extra>'
+    for col, (_, df_top, color, categoryorder) in enumerate(_sides, start=1):
+        fig.add_trace(go.Bar(x=df_top[x_col], y=df_top[y_col].astype(str), orientation='h', marker_color=color,
+                             texttemplate='%{x:,.0f}', textposition='outside', hovertemplate=hovertemplate),
+                      row=1, col=col)
+        fig.update_yaxes(categoryorder=categoryorder, row=1, col=col)
+        fig.update_xaxes(title_text=x_col, row=1, col=col)
+    fig.update_yaxes(title_text=y_col, row=1, col=1)
+    fig.update_layout(showlegend=False)
+    return fig
+
+@st.cache_resource(max_entries=16)
+def ownership_pies_figure(_pies, data_key, stock_code):
+    """(TAB 3) Pie kepemilikan terbaru dalam SATU figure (subplot domain) -> satu payload JSON.
+
+    `_pies` = list (judul, labels, values); isinya ditentukan penuh oleh (data_key, stock_code).
+    """
+    fig = make_subplots(rows=1, cols=len(_pies), specs=[[{'type': 'domain'}] * len(_pies)],
+                        subplot_titles=[title for title, _, _ in _pies])
+    for col, (_, labels, values) in enumerate(_pies, start=1):
+        fig.add_trace(go.Pie(labels=labels, values=values, hole=0.3, textinfo='percent+label',
+                             texttemplate='%{label}(%{percent})', sort=False), row=1, col=col)
+    fig.update_layout(showlegend=False, margin=dict(l=20, r=20, t=40, b=20))
+    return fig
+
+@st.cache_resource(max_entries=16)
+def historical_ownership_figure(_df_hist_raw, data_key, stock_code, years):
+    """(TAB 3) Line chart tren jumlah kepemilikan per kategori."""
+    fig = px.line(
+        _df_hist_raw,
+        x='Date',
+        y='Jumlah Saham', # Data diubah ke Jumlah Saham
+        color='Kategori',
+        title=f'Tren Jumlah Kepemilikan {stock_code}',
+        labels={'Date': 'Tanggal', 'Jumlah Saham': 'Jumlah Saham'}, # Label diubah
+        render_mode='webgl' # Scattergl: 18 garis x histori panjang tanpa SVG per titik
+    )
+    fig.update_layout(hovermode='x unified', yaxis_tickformat=',.0f') # Format koma di sumbu Y
+    # Hover template diubah ke Jumlah Saham
+    fig.update_traces(hovertemplate='Tgl: %{x|%d%b%y}<br>%{fullData.name}: %{y:,.0f}<extra></extra>')
+    return fig
+
+@st.cache_resource(max_entries=16)
+def monthly_sector_flow_figure(_df_monthly_sec_flow_top, data_key, years):
+    """(TAB 4) Line chart aliran dana bersih bulanan top 10 sektor."""
+    fig = px.line(_df_monthly_sec_flow_top, x='Month', y='Net Flow (Shares)', color='Sector', title='Tren Aliran Dana Bersih Bulanan (Top 10 Sektor)', labels={'Month': 'Bulan', 'Net Flow (Shares)': 'Net Flow Bulanan (Saham)'}, markers=True, render_mode='webgl')
+    fig.update_layout(hovermode='x unified')
+    fig.update_traces(hovertemplate='Bulan: %{x|%b %Y}<br>Sektor: %{fullData.name}<br>Flow: %{y:,.0f}<extra></extra>')
+    return fig